@@ -3,6 +3,7 @@
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
 from os.path import isdir
 from engine.preprocessing.repoinfo import RepoInfo
+from engine.errors.user_input import UserInputError
 from engine.algorithms import IODINE, CHLORINE, OXYGEN
 
 
@@ -65,15 +66,31 @@ def handle_cli_args():
     """
     Parse the command line arguments and handle them.
 
-    If there is any problem, an error message will be printed
-    and the script will exit with a non-zero exit code.
     If everything goes right, tuple of local repository paths will be returned.
 
+    Raises:
+        UserInputError -- When a repository path cannot be resolved
+                          into a local directory. The error carries
+                          exit code 2, matching argparse's convention
+                          for command line usage errors.
+
     Returns:
         tuple[string] -- Tuple of local repository paths.
 
     """
     args = parser.parse_args()
 
-    return tuple(repo_path_to_local_path(p) for p in
-                 (args.first_repo, args.second_repo)), args.algorithm
+    repos = []
+
+    # Invalid paths are rejected here, before any repository
+    # is parsed, rather than failing later mid-analysis.
+    for repo_path in (args.first_repo, args.second_repo):
+        local_path = repo_path_to_local_path(repo_path)
+
+        if repo_path is not None and local_path is None:
+            raise UserInputError(
+                f"Invalid repository path: \"{repo_path}\"", 2)
+
+        repos.append(local_path)
+
+    return tuple(repos), args.algorithm
@@ -21,8 +21,9 @@ def oxygen(modules, weight_limit=15):
 
     """
     # Dictionary of all the different shapes of node trees.
-    # Key is a string representation of the tree.
-    # Value is a list of all nodes with the exact same string representation.
+    # Key is the node's weight combined with its structural hash,
+    # which is much cheaper than building a full string representation.
+    # Value is a list of all nodes with the exact same tree shape.
     # These nodes are often referred to as "origins" throughout the project.
     node_dict = {}
 
@@ -36,13 +37,13 @@ def oxygen(modules, weight_limit=15):
                 visited.add(n.index)
                 continue
 
-            node_dump = _dump_node(n)
+            node_key = (n.weight, n.structural_hash)
 
-            if node_dump in node_dict:
+            if node_key in node_dict:
                 visited.add(n.index)
-                node_dict[node_dump].append(n)
+                node_dict[node_key].append(n)
             else:
-                node_dict[node_dump] = [n]
+                node_dict[node_key] = [n]
 
     # Transform the dictionary into a list of detected clones.
     clones = []
@@ -51,7 +52,18 @@ def oxygen(modules, weight_limit=15):
         if len(origin_list) <= 1:
             continue
 
-        clones.append(DetectedClone(
-            origin_list[0].value, origin_list[0].weight, nodes=origin_list))
+        # Hash collisions are rare, but the exact string representation
+        # is still compared within each bucket to rule them out.
+        dump_dict = {}
+
+        for n in origin_list:
+            dump_dict.setdefault(_dump_node(n), []).append(n)
+
+        for dump_origins in dump_dict.values():
+            if len(dump_origins) <= 1:
+                continue
+
+            clones.append(DetectedClone(
+                dump_origins[0].value, dump_origins[0].weight, nodes=dump_origins))
 
     return DetectionResult(clones)
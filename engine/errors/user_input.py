@@ -15,6 +15,8 @@ class UserInputError(Exception):
 
     """
 
+    __slots__ = ("message", "code")
+
     def __init__(self, message, code=1):
         """
         Initialize a new user input error instance.
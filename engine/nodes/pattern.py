@@ -1,5 +1,7 @@
 """Module containing the `PatternNode` class."""
 
+from sys import intern
+
 _HOLE = "Hole"
 
 
@@ -14,6 +16,8 @@ class PatternNode:
 
     """
 
+    __slots__ = ("nodes", "value", "children", "_hash")
+
     def __init__(self, node1, node2, value=None):
         """
         Create a new PatternNode from two nodes and their common value.
@@ -26,9 +30,13 @@ class PatternNode:
 
         """
         self.nodes = [node1, node2]
-        self.value = value or _HOLE
+        self.value = intern(value) if value else _HOLE
         self.children = []
 
+        # Memoized structural hash used to short-circuit skeleton comparison.
+        # It is kept up to date by `add_child`.
+        self._hash = hash((self.value, ()))
+
     def add_node(self, node):
         """
         Append the supplied nodes to this node's list of origin nodes.
@@ -48,6 +56,7 @@ class PatternNode:
 
         """
         self.children.append(child)
+        self._hash = hash((self.value, tuple(c._hash for c in self.children)))
 
     def skeleton_equals(self, other):
         """
@@ -60,7 +69,8 @@ class PatternNode:
             bool -- True if the nodes have an equal skeleton, False otherwise.
 
         """
-        if not isinstance(other, PatternNode) or other.value != self.value or \
+        if not isinstance(other, PatternNode) or other._hash != self._hash or \
+                other.value != self.value or \
                 len(other.children) != len(self.children):
             return False
 
@@ -79,7 +89,17 @@ class PatternNode:
 
         """
         return 0 if self.value == _HOLE else \
-            (1 + sum([c.get_match_weight() for c in self.children]))
+            (1 + sum(c.get_match_weight() for c in self.children))
+
+    def __hash__(self):
+        """
+        Get the pattern node's memoized structural hash.
+
+        The hash changes whenever a child is added, so pattern nodes
+        must not be stored in hash-based containers while they are
+        still being built by the anti-unification.
+        """
+        return self._hash
 
     def __str__(self):
         """Convert the pattern node into a human-readable string."""
@@ -1,10 +1,15 @@
 """Module containing the `TreeNode` class."""
 
 import ast
+from sys import intern
 from .nodeorigin import NodeOrigin
 
-_IGNORE_CLASSES = [ast.Load, ast.Store, ast.Del,
-                   ast.AugLoad, ast.AugStore, ast.Param]
+# Both class collections are frozen sets so that the per-child
+# membership tests during parsing are hash lookups, not linear scans.
+_IGNORE_CLASSES = frozenset({ast.Load, ast.Store, ast.Del,
+                             ast.AugLoad, ast.AugStore, ast.Param})
+
+_DOCSTRING_CLASSES = frozenset({ast.ClassDef, ast.FunctionDef})
 
 
 class TreeNode:
@@ -19,6 +24,9 @@ class TreeNode:
         origin {NodeOrigin} -- Origin of the node (file path, line and column).
         children {list[TreeNode]} -- List of direct children of this node.
         weight {int} -- Total number of nodes in this node's tree.
+        structural_hash {int} -- Merkle-style hash of this node's tree shape.
+                                 Equal trees always have an equal hash,
+                                 so it can be used as a cheap bucketing key.
         names {list[string]} -- All names / symbols used in this node's tree.
         value {string} -- String representation of just this node.
         index {int} -- Index of this node (in an external flat list of nodes).
@@ -27,6 +35,12 @@ class TreeNode:
 
     """
 
+    # One TreeNode exists per AST node, so dropping the per-instance
+    # dictionary saves a substantial amount of memory on large repos.
+    __slots__ = ("node", "origin", "children", "weight", "structural_hash",
+                 "names", "value", "index", "parent_index", "child_indices",
+                 "_dump")
+
     def __init__(self, node, origin_file):
         """
         Initialize a new tree node instance.
@@ -40,8 +54,11 @@ class TreeNode:
         self.origin = NodeOrigin(origin_file, node.lineno, node.col_offset) \
             if node._attributes else NodeOrigin(origin_file)
 
+        # Memoized result of `dump`; serialized lazily on first use.
+        self._dump = None
+
         # Check if this type of node can have docstring.
-        can_have_docstring = node.__class__ in [ast.ClassDef, ast.FunctionDef]
+        can_have_docstring = node.__class__ in _DOCSTRING_CLASSES
 
         # HACK: Ignore useless context-related children.
         # This should greatly reduce the total number of nodes.
@@ -53,20 +70,34 @@ class TreeNode:
                           not isinstance(n, ast.Expr) or
                           not isinstance(n.value, ast.Str))]
 
-        self.weight = 1 + sum([c.weight for c in self.children])
+        self.weight = 1 + sum(c.weight for c in self.children)
 
+        # Values are interned because an AST contains only a handful of
+        # distinct ones; comparing them then starts with an identity check.
         # Name nodes are handled in a special way.
         if isinstance(node, ast.Name):
-            self.value = f"Name('{node.id}')"
+            self.value = intern(f"Name('{node.id}')")
             self.names = [node.id]
 
         else:
             # Class name if the node has children, AST dump if it does not.
-            self.value = node.__class__.__name__ if self.children else self.dump()
-
-            self.names = []
-            for c in self.children:
-                self.names.extend(c.names)
+            self.value = intern(
+                node.__class__.__name__ if self.children else self.dump())
+
+            # Names are accumulated bottom-up in a single pass.
+            # Single-child nodes reuse the child's list instead of
+            # copying it; the lists are never mutated after parsing.
+            if len(self.children) == 1:
+                self.names = self.children[0].names
+            else:
+                self.names = []
+                for c in self.children:
+                    self.names.extend(c.names)
+
+        # The children's hashes already exist at this point,
+        # so the whole tree is hashed in a single bottom-up pass.
+        self.structural_hash = hash(
+            (self.value, tuple(c.structural_hash for c in self.children)))
 
         # These values are set externally after all nodes are parsed
         # during the node tree flattening process.
@@ -78,11 +109,17 @@ class TreeNode:
         """
         Convert the node into a string using the built-in function.
 
+        The string is serialized only once and memoized, since it is
+        requested repeatedly by the equality operator.
+
         Returns:
             string -- String representation of the AST node.
 
         """
-        return ast.dump(self.node)
+        if self._dump is None:
+            self._dump = ast.dump(self.node)
+
+        return self._dump
 
     def get_all_children(self):
         """
@@ -92,10 +129,15 @@ class TreeNode:
             list[TreeNode] -- List of all the recursively found children.
 
         """
-        children = self.children.copy()
+        # A single iterative walk appending into one shared list avoids
+        # the per-level list copying of a naive recursive implementation.
+        children = []
+        node_stack = [self]
 
-        for c in self.children:
-            children.extend(c.get_all_children())
+        while node_stack:
+            n = node_stack.pop()
+            children.extend(n.children)
+            node_stack.extend(n.children)
 
         return children
 
@@ -114,6 +156,10 @@ class TreeNode:
         """
         if not isinstance(other, TreeNode):
             return False
+        elif other.structural_hash != self.structural_hash:
+            # Equal trees always have equal structural hashes,
+            # so a hash mismatch rules the match out in O(1).
+            return False
         elif other.dump() == self.dump():
             return True
         elif other.value != self.value:
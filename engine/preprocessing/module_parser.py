@@ -48,23 +48,22 @@ def _get_tree_node_from_file(file_path, repo_path):
 
 def _recursive_listdir_py(directory):
     """
-    Return relative paths of all *.py files in the specified directory.
+    Yield relative paths of all *.py files in the specified directory.
+
+    The file paths are streamed one at a time instead of being
+    collected into a list at every level of the directory tree.
 
     If the provided argument is not a valid directory,
     an internal exception will be thrown by Python.
     That exception will most likely be NotImplementedError.
     """
-    files = []
-
     for item in listdir(directory):
         fullpath = path.join(directory, item)
 
         if isfile(fullpath) and item.endswith("py"):
-            files.append(fullpath)
+            yield fullpath
         elif isdir(fullpath):
-            files.extend(_recursive_listdir_py(fullpath))
-
-    return files
+            yield from _recursive_listdir_py(fullpath)
 
 
 def _flatten_module_nodes(module):
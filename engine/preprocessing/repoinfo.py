@@ -64,8 +64,10 @@ class RepoInfo:
                 repo.remotes.origin.pull()
 
             # If the repo hasn't been cloned yet, clone it.
+            # A shallow clone is enough because only the files
+            # of the latest commit are ever analyzed.
             else:
-                repo = Repo.clone_from(self.url, self.dir)
+                repo = Repo.clone_from(self.url, self.dir, depth=1)
 
             # Get HEAD's hash and store it in repo info.
             self.hash = repo.head.object.hexsha
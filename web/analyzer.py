@@ -1,10 +1,15 @@
 """Module containing logic used by the web app for repository analysis."""
 
 import re
-from threading import Thread
-from itertools import chain
+from os import cpu_count
+from hashlib import blake2b
+from traceback import format_exc
+from multiprocessing import Pool
+from queue import LifoQueue, Empty, Full
+from concurrent.futures import ThreadPoolExecutor
 from fastlog import log
 from psycopg2 import Error as PG_Error
+from psycopg2.extras import execute_values
 from easy_postgres import Connection as pg_conn
 from engine.preprocessing.repoinfo import RepoInfo
 from engine.preprocessing.module_parser import get_modules_from_dir
@@ -19,50 +24,200 @@ from .pg_error_handler import handle_pg_error
 _SELECT_REPO_JOIN_STATUS = """SELECT repos.*, states.name AS "status_name", states.description AS "status_desc" """ + \
     """FROM repos JOIN states ON (repos.status = states.id) """
 
+# Compiled once at import time; this runs on every web request.
+_REGEX_REPO_PATH = re.compile(r"^[\w\.\-]+$")
 
-def _get_pattern_id(conn, node):
-    dump = node.dump()
-    dump_md5 = conn.one("""SELECT MD5(%s);""", dump)
+# Cloning is network-bound and analysis is CPU-bound, so each phase has
+# its own pool and repo N+1 can be cloned while repo N is being analyzed.
+# Parallel clones cannot collide because every repository
+# is cloned into its own directory (server/user/name).
+_clone_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="clone")
+_analysis_pool = ThreadPoolExecutor(max_workers=min(32, (cpu_count() or 1) * 2),
+                                    thread_name_prefix="analysis")
 
-    pattern_id = conn.one("""INSERT INTO patterns ("dump", "hash", "weight", "class") """ +
-                          """VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING RETURNING id;""",
-                          dump, dump_md5, node.weight, node.node.__class__.__name__)
+# Pool of idle database connections shared by all the worker threads.
+# Opening a connection costs a full TCP + authentication handshake,
+# so idle connections are reused instead of opening a new one per call.
+_idle_conns = LifoQueue(maxsize=32)
 
-    if pattern_id is None:
-        pattern_id = conn.one(
-            """SELECT id FROM patterns WHERE "hash" = %s;""", dump_md5)
 
-    return pattern_id
+def _borrow_conn():
+    """Take an idle connection from the pool or open a new one."""
+    try:
+        return _idle_conns.get_nowait()
+    except Empty:
+        return pg_conn(db_url)
 
 
-def _extract_patterns(conn, commit_id, modules):
-    nodes = chain.from_iterable(modules)
+def _return_conn(conn):
+    """
+    Put a connection back into the idle pool.
 
-    for n in nodes:
-        pattern_id = _get_pattern_id(conn, n)
+    Connections that have died (e.g., after a fatal database error)
+    are dropped, and so are healthy ones when the pool is full.
+    """
+    try:
+        if not conn.conn.closed:
+            _idle_conns.put_nowait(conn)
+            return
+    except Full:
+        pass
 
-        conn.run("""INSERT INTO pattern_instances """ +
-                 """(pattern_id, commit_id, "file", "line", col_offset) """ +
-                 """VALUES (%s, %s, %s, %s, %s);""",
-                 pattern_id, commit_id,
-                 n.origin.file, n.origin.line, n.origin.col_offset)
+    conn.close()
 
 
-def analyze_repo(repo_info, repo_id, algorithm=OXYGEN):
-    """Analyze the repo using the specified algorithm. Store results in db."""
-    log.info(f"Analyzing repository: {repo_info}")
+def _get_dump_hash(dump):
+    """
+    Hash a pattern dump into its deduplication key.
+
+    BLAKE2b is noticeably faster than MD5 in CPython and the hash is
+    only used as a dedup key, so cryptographic strength is irrelevant.
+    The 16-byte digest gives the same 32-character hex string the
+    previous MD5-based hashing produced.
+    """
+    return blake2b(dump.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _serialize_module_nodes(module):
+    """
+    Serialize all nodes of a single module into pattern records.
+
+    This is the CPU-heavy part of the pattern extraction,
+    so it runs in worker processes, one module at a time.
+    Duplicate patterns are already collapsed here, so each distinct
+    dump string crosses the process boundary only once.
+
+    Returns:
+        tuple -- Dictionary of (dump, hash, weight, class) pattern
+                 rows keyed by hash and a list of (hash, file, line,
+                 col_offset) instance rows, one per node.
+
+    """
+    pattern_rows = {}
+    instance_rows = []
+
+    for n in module:
+        dump = n.dump()
+        dump_hash = _get_dump_hash(dump)
+
+        if dump_hash not in pattern_rows:
+            pattern_rows[dump_hash] = (dump, dump_hash, n.weight,
+                                       n.node.__class__.__name__)
+
+        instance_rows.append((dump_hash, n.origin.file,
+                              n.origin.line, n.origin.col_offset))
+
+    return pattern_rows, instance_rows
+
+
+def _serialize_pattern_nodes(modules):
+    """
+    Serialize the nodes of all modules using a pool of worker processes.
+
+    Returns:
+        tuple -- Merged pattern row dictionary and instance row list
+                 in the format produced by `_serialize_module_nodes`.
+
+    """
+    pattern_rows = {}
+    instance_rows = []
+
+    with Pool() as pool:
+        for module_patterns, module_instances in \
+                pool.map(_serialize_module_nodes, modules):
+            pattern_rows.update(module_patterns)
+            instance_rows.extend(module_instances)
+
+    return pattern_rows, instance_rows
+
+
+def _extract_patterns(conn, commit_id, pattern_rows, instance_rows):
+    # Pattern rows are keyed by their hash, both to avoid inserting
+    # the same pattern twice and because a single batched INSERT
+    # cannot contain two rows with the same conflict key.
+    if not pattern_rows:
+        return
+
+    with conn.cursor() as cur:
+        # The otherwise pointless DO UPDATE makes the RETURNING clause
+        # also yield the ids of patterns that already existed.
+        id_rows = execute_values(
+            cur,
+            """INSERT INTO patterns ("dump", "hash", "weight", "class") VALUES %s """ +
+            """ON CONFLICT ("hash") DO UPDATE SET "hash" = EXCLUDED."hash" RETURNING id, "hash";""",
+            list(pattern_rows.values()), fetch=True)
+
+        pattern_ids = {h: i for i, h in id_rows}
+
+        execute_values(
+            cur,
+            """INSERT INTO pattern_instances """ +
+            """(pattern_id, commit_id, "file", "line", col_offset) VALUES %s;""",
+            [(pattern_ids[h], commit_id, file, line, col)
+             for h, file, line, col in instance_rows])
+
+
+def _clone_repo(repo_info, repo_id):
+    """
+    Clone or pull the repo. This is the network-bound phase of the analysis.
+
+    Returns:
+        bool -- True if the repository is ready to be analyzed.
+
+    """
+    log.info(f"Cloning repository: {repo_info}")
 
     try:
-        conn = pg_conn(db_url)
+        conn = _borrow_conn()
 
         if repo_info.clone_or_pull():
             log.success(
                 f"Repository has been successfully cloned: {repo_info}")
 
-        else:
-            log.warning(f"Unable to clone repository: {repo_info}")
+            return True
+
+        log.warning(f"Unable to clone repository: {repo_info}")
+
+        conn.run("""UPDATE repos SET status = (SELECT id FROM states WHERE name = 'err_clone') WHERE id = %s;""",
+                 repo_id)
+
+        return False
+
+    except PG_Error as ex:
+        handle_pg_error(ex, conn, repo_id)
+        return False
+
+    finally:
+        _return_conn(conn)
+
+
+def queue_repo_analysis(repo_info, repo_id):
+    """Queue the repo for cloning followed by analysis on the worker pools."""
+    def _handle_clone_result(clone_future):
+        if clone_future.result():
+            _analysis_pool.submit(analyze_repo, repo_info, repo_id)
+
+    clone_future = _clone_pool.submit(_clone_repo, repo_info, repo_id)
+    clone_future.add_done_callback(_handle_clone_result)
+
+
+def analyze_repo(repo_info, repo_id, algorithm=OXYGEN):
+    """Analyze an already cloned repo. Store the results in the database."""
+    log.info(f"Analyzing repository: {repo_info}")
+
+    try:
+        conn = _borrow_conn()
+
+        # The clone phase has already resolved the HEAD commit hash.
+        # If this exact commit has been analyzed before, the stored
+        # results are still valid and the analysis can be skipped
+        # (re-running it would also violate the commits table's
+        # uniqueness of the repository/hash combination).
+        if conn.one("""SELECT id FROM commits WHERE repo_id = %s AND "hash" = %s;""",
+                    repo_id, repo_info.hash) is not None:
+            log.info(f"Commit has already been analyzed: {repo_info}")
 
-            conn.run("""UPDATE repos SET status = (SELECT id FROM states WHERE name = 'err_clone') WHERE id = %s;""",
+            conn.run("""UPDATE repos SET status = (SELECT id FROM states WHERE name = 'done') WHERE id = %s;""",
                      repo_id)
 
             return
@@ -94,9 +249,13 @@ def analyze_repo(repo_info, repo_id, algorithm=OXYGEN):
             conn.run("""UPDATE repos SET status = (SELECT id FROM states WHERE name = 'done') WHERE id = %s;""",
                      repo_id)
 
-        # Once done with the regular analysis, run pattern extraction
+        # Once done with the regular analysis, run pattern extraction.
+        # Node serialization is pure CPU work, so it runs in a process
+        # pool before the transaction opens instead of blocking it.
+        pattern_rows, instance_rows = _serialize_pattern_nodes(modules)
+
         with conn.transaction():
-            _extract_patterns(conn, commit_id, modules)
+            _extract_patterns(conn, commit_id, pattern_rows, instance_rows)
 
         log.success(
             f"Pattern extraction from was successful: {repo_info}")
@@ -104,8 +263,16 @@ def analyze_repo(repo_info, repo_id, algorithm=OXYGEN):
     except PG_Error as ex:
         handle_pg_error(ex, conn, repo_id)
 
+    except Exception:
+        # The worker pool would silently swallow the exception,
+        # leaving the repository stuck in the queue state forever.
+        log.error(f"Repository analysis failed: {repo_info}\n{format_exc()}")
+
+        conn.run("""UPDATE repos SET status = (SELECT id FROM states WHERE name = 'err_analysis') WHERE id = %s;""",
+                 repo_id)
+
     finally:
-        conn.close()
+        _return_conn(conn)
 
 
 def find_repo_results(conn, repo_id):
@@ -129,48 +296,101 @@ def find_repo_results(conn, repo_id):
     return DetectionResult(clones)
 
 
-def _find_repos_select_query(conn, where, params):
-    """Helper function for running `SELECT` SQL queries to find repos."""
-    return conn.all_dict(_SELECT_REPO_JOIN_STATUS + f"""WHERE ({where});""", params)
+_FIND_REPOS_CONDITIONS = [
+    # Match tiers of the repository metadata lookup, ordered from the
+    # best (exact repo name) to the worst (partial server name) match.
+    # The second element is the parameter template the repository path
+    # is substituted into.
+    # Exact repo name match.
+    ("""repos."name" = %s""", "{}"),
+    ("""LOWER(repos."name") = LOWER(%s)""", "{}"),
+    # Exact user name match.
+    ("""repos."user" = %s""", "{}"),
+    ("""LOWER(repos."user") = LOWER(%s)""", "{}"),
+    # Exact server name match.
+    ("""repos."server" = %s""", "{}"),
+    ("""LOWER(repos."server") = LOWER(%s)""", "{}"),
+    # Partial repo name match.
+    ("""repos."name" LIKE %s""", "{}%"),
+    ("""repos."name" LIKE %s""", "%{}"),
+    ("""repos."name" LIKE %s""", "%{}%"),
+    ("""repos."name" ILIKE %s""", "{}%"),
+    ("""repos."name" ILIKE %s""", "%{}"),
+    ("""repos."name" ILIKE %s""", "%{}%"),
+    # Partial user name match.
+    ("""repos."user" LIKE %s""", "{}%"),
+    ("""repos."user" LIKE %s""", "%{}"),
+    ("""repos."user" LIKE %s""", "%{}%"),
+    ("""repos."user" ILIKE %s""", "{}%"),
+    ("""repos."user" ILIKE %s""", "%{}"),
+    ("""repos."user" ILIKE %s""", "%{}%"),
+    # Partial server name (e.g., repos."github" instead of repos."github.com").
+    ("""repos."server" ILIKE %s""", "%{}%")
+]
+
+
+def _build_find_repos_prepare():
+    """
+    Build the `PREPARE` statement for the repo metadata lookup query.
+
+    All the match tiers are evaluated in a single query instead of one
+    round-trip per tier: every matching repo is ranked by the best
+    (lowest) tier it satisfies. The CASE expression uses parameters
+    $1..$n and the WHERE clause the second half $n+1..$2n.
+    """
+    tier_count = len(_FIND_REPOS_CONDITIONS)
+
+    rank_cases = " ".join(
+        f"WHEN {cond.replace('%s', f'${i + 1}')} THEN {i}"
+        for i, (cond, _) in enumerate(_FIND_REPOS_CONDITIONS))
+
+    where = " OR ".join(
+        cond.replace("%s", f"${tier_count + i + 1}")
+        for i, (cond, _) in enumerate(_FIND_REPOS_CONDITIONS))
+
+    param_types = ", ".join(["text"] * (2 * tier_count))
+
+    return (f"""PREPARE find_repos_by_metadata ({param_types}) AS """ +
+            """SELECT repos.*, states.name AS "status_name", states.description AS "status_desc", """ +
+            f"""CASE {rank_cases} END AS "match_rank" """ +
+            """FROM repos JOIN states ON (repos.status = states.id) """ +
+            f"""WHERE ({where}) ORDER BY "match_rank";""")
+
+
+_FIND_REPOS_PREPARE = _build_find_repos_prepare()
+
+_FIND_REPOS_EXECUTE = """EXECUTE find_repos_by_metadata(""" + \
+    ", ".join(["%s"] * (2 * len(_FIND_REPOS_CONDITIONS))) + """);"""
 
 
 def _find_repos_by_metadata(conn, repo_path):
     """Attempt to find the best match for the specified repository."""
-    CONDITIONS = [
-        # Exact repo name match.
-        ("""repos."name" = %s""", repo_path),
-        ("""LOWER(repos."name") = LOWER(%s)""", repo_path),
-        # Exact user name match.
-        ("""repos."user" = %s""", repo_path),
-        ("""LOWER(repos."user") = LOWER(%s)""", repo_path),
-        # Exact server name match.
-        ("""repos."server" = %s""", repo_path),
-        ("""LOWER(repos."server") = LOWER(%s)""", repo_path),
-        # Partial repo name match.
-        ("""repos."name" LIKE %s""", f"{repo_path}%"),
-        ("""repos."name" LIKE %s""", f"%{repo_path}"),
-        ("""repos."name" LIKE %s""", f"%{repo_path}%"),
-        ("""repos."name" ILIKE %s""", f"{repo_path}%"),
-        ("""repos."name" ILIKE %s""", f"%{repo_path}"),
-        ("""repos."name" ILIKE %s""", f"%{repo_path}%"),
-        # Partial user name match.
-        ("""repos."user" LIKE %s""", f"{repo_path}%"),
-        ("""repos."user" LIKE %s""", f"%{repo_path}"),
-        ("""repos."user" LIKE %s""", f"%{repo_path}%"),
-        ("""repos."user" ILIKE %s""", f"{repo_path}%"),
-        ("""repos."user" ILIKE %s""", f"%{repo_path}"),
-        ("""repos."user" ILIKE %s""", f"%{repo_path}%"),
-        # Partial server name (e.g., repos."github" instead of repos."github.com").
-        ("""repos."server" ILIKE %s""", f"%{repo_path}%")
-    ]
-
-    for c in CONDITIONS:
-        repos = _find_repos_select_query(conn, *c)
-
-        if repos:
-            return repos
-
-    return None
+    # The partial-match tiers rely on the pg_trgm GIN indexes and the
+    # case-insensitive tiers on the LOWER() b-tree indexes created by
+    # prepare_tables.pgsql; without them every miss is a full scan.
+    # The statement is prepared once per pooled connection, so Postgres
+    # parses and plans the large query a single time per session.
+    if not getattr(conn, "_find_repos_prepared", False):
+        conn.run(_FIND_REPOS_PREPARE)
+        conn._find_repos_prepared = True
+
+    params = tuple(param.format(repo_path)
+                   for _, param in _FIND_REPOS_CONDITIONS)
+
+    repos = conn.all_dict(_FIND_REPOS_EXECUTE, params + params)
+
+    if not repos:
+        return None
+
+    # Only the repos sharing the overall best rank are returned, which
+    # preserves the original "return the first non-empty tier" semantics.
+    best_rank = repos[0].match_rank
+    best_repos = [r for r in repos if r.match_rank == best_rank]
+
+    for r in best_repos:
+        del r["match_rank"]
+
+    return best_repos
 
 
 def _try_insert_repo(conn, repo_info):
@@ -241,10 +461,10 @@ def get_repo_analysis(repo_path):
     try:
         repo_info = RepoInfo.parse_repo_info(repo_path)
 
-        conn = pg_conn(db_url)
+        conn = _borrow_conn()
 
         if not repo_info:
-            if re.fullmatch(r"^[\w\.\-]+$", repo_path):
+            if _REGEX_REPO_PATH.fullmatch(repo_path):
                 repos = _find_repos_by_metadata(conn, repo_path)
 
                 # No repository matches the given repository path.
@@ -266,7 +486,7 @@ def get_repo_analysis(repo_path):
         repo_id = _try_insert_repo(conn, repo_info)
 
         if repo_id is not None:
-            Thread(target=analyze_repo, args=(repo_info, repo_id)).start()
+            queue_repo_analysis(repo_info, repo_id)
             return "The repository has been added to the queue"
 
         repo_dict = _get_repo_dict_from_repoinfo(conn, repo_info)
@@ -278,4 +498,4 @@ def get_repo_analysis(repo_path):
         return "Database error"
 
     finally:
-        conn.close()
+        _return_conn(conn)